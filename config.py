@@ -20,8 +20,11 @@ companies = [
 		"active": False, # Temporarily turn this company off
 		"no_jobs_phrase": "Sorry, we couldn't find anything here", # If specified, will search for of this phrase in the whole page to mean that there are no jobs. This is good to specify if you can. Make sure it's one continuous piece of text in the HTML, or use a shorter phrase that's continuous.
 		"relevant_search_terms": ["carpenter", "rocket scientist"], # If specified, will only consider jobs with "carpenter" or "rocket scientist" relevant
-		"load_sleep": 1, # Modify to increase/decrease the sleep time after load
+		"load_sleep": 1, # Modify to increase/decrease the sleep time after load. The page is returned as soon as the DOM is ready, so lower this (even to 0) for pages that render their jobs without JS
 		"scroll_sleep": 1, # Modify to increase/decrease the sleep time after scrolling to the bottom
+		"ready_selector": ".posting", # If specified, instead of load_sleep and scroll_sleep, waits for elements matching this CSS selector to appear and then stop increasing in number
+		"ready_timeout": 10, # Max seconds to wait on ready_selector
+		"block_css": True, # Skip loading stylesheets to speed up the page. Only set this if the page still shows the same text without them, since CSS-hidden text (e.g. a "no results" template) becomes visible and can be mistaken for a no jobs phrase
 
 		# Other optional keys for note taking, are not used
 		"diff_page": False,
@@ -3,40 +3,59 @@
 
 import argparse
 import datetime
+import importlib
 import json
 import os
+import threading
 import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import asdict
 from tempfile import mkdtemp
 
 from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
 
 from models import *
 
-def get_new_relevant_jobs(driver, run_record: RunRecord, limit_company = None, additional_search_term = None):
+# Scraping only reads text and attributes, so skip downloading resources that only affect how the page looks
+FONT_URL_PATTERNS = ["*.woff*", "*.ttf*", "*.otf*"]
+STYLESHEET_URL_PATTERNS = ["*.css*"]
+
+GENERIC_NO_JOBS_PHRASES = ['No available positions', "No positions", "Sorry", "No job", "No current", "No open", 'None available', 'Don\'t have', 'don\'t currently', 'No openings']
+GENERIC_NO_JOBS_PHRASES_LOWER = [phrase.lower() for phrase in GENERIC_NO_JOBS_PHRASES]
+
+# Search the page text in the browser, rather than transferring the whole text back just to search it
+FIND_PHRASES_SCRIPT = """
+const text = document.body ? document.body.innerText.toLowerCase() : "";
+if (text === "") {
+    return null;
+}
+return arguments[0].map(phrase => text.includes(phrase));
+"""
+
+def get_new_relevant_jobs(driver_factory, run_record: RunRecord, limit_company = None, additional_search_term = None, max_workers = 1):
     existing_jobs = defaultdict(set, {key: set(value) for key, value in run_record.existing_jobs.items()})
 
-    relevant_jobs, skipped_companies, verify_no_jobs, errors = get_relevant_jobs(driver, limit_company, additional_search_term)
-    new_relevant_jobs = {}
+    relevant_jobs, skipped_companies, verify_no_jobs, errors = get_relevant_jobs(driver_factory, limit_company, additional_search_term, max_workers)
+    new_relevant_jobs = defaultdict(lambda: {"company": None, "jobs": []})
 
     # Group jobs by company, and update existing
     for company, job in relevant_jobs:
-        if job.id not in existing_jobs[company.name]:
-            if company.name in new_relevant_jobs:
-                new_relevant_jobs[company.name]["jobs"].append(job)
-            else:
-                new_relevant_jobs[company.name] = {
-                    "company": company,
-                    "jobs": [job]
-                }
-
-            existing_jobs[company.name].add(job.id)
+        if job.id in existing_jobs[company.name]:
+            continue
+        company_new_jobs = new_relevant_jobs[company.name]
+        company_new_jobs["company"] = company
+        company_new_jobs["jobs"].append(job)
+        existing_jobs[company.name].add(job.id)
+    new_relevant_jobs = dict(new_relevant_jobs)
 
-    existing_jobs = {key: sorted(list(value)) for key, value in existing_jobs.items()}
+    # Only companies with new jobs changed, so leave the rest as already sorted lists
+    existing_jobs = {**run_record.existing_jobs, **{company_name: sorted(existing_jobs[company_name]) for company_name in new_relevant_jobs}}
 
 
     # Annotate if errors are new, and create new run record
@@ -57,82 +76,170 @@ def get_new_relevant_jobs(driver, run_record: RunRecord, limit_company = None, a
 
     return new_relevant_jobs, run_record, verify_no_jobs
 
-def get_relevant_jobs(driver, limit_company, additional_search_term):
+# Parsed config, reused while config.py and scrapers.py are unchanged on disk, e.g. across warm lambda invocations
+config_cache = {}
+
+def load_config() -> (list[Company], list[str]):
+    # Dynamic import so that we can e.g. dynamically pull this file from s3, and change the config without repackaging the docker image
+    import config
+    import scrapers
+    config_mtimes = (os.path.getmtime(config.__file__), os.path.getmtime(scrapers.__file__))
+    if config_cache.get("mtimes") != config_mtimes:
+        if "mtimes" in config_cache:
+            # Already imported an older version, which import alone won't replace
+            importlib.reload(scrapers)
+            config = importlib.reload(config)
+        config_cache["mtimes"] = config_mtimes
+        config_cache["companies"] = [Company(**company) for company in config.companies]
+        config_cache["search_terms"] = list(config.search_terms)
+    return config_cache["companies"], list(config_cache["search_terms"])
+
+def get_relevant_jobs(driver_factory, limit_company, additional_search_term, max_workers = 1):
     relevant_jobs: list[tuple[Company, list[JobPosting]]] = []
     skipped_companies = []
     verify_no_jobs = []
     errors: list[tuple[str, Exception]] = []
 
-    # Dynamic import so that we can e.g. dynamically pull this file from s3, and change the config without repackaging the docker image
-    import config
-    companies = [Company(**company) for company in config.companies]
-
-    search_terms = config.search_terms
+    companies, search_terms = load_config()
     if additional_search_term:
         search_terms.append(additional_search_term)
+    search_terms_lower = [search_term.lower() for search_term in search_terms]
 
+    companies_to_check = []
     for company in companies:
         if limit_company and limit_company.lower() not in company.name.lower():
             continue
         
         if company.active:
             assert company.jobs_page
-            print("Checking", company.name)
-            try:
-                company_relevant_jobs, jobs_page_status = get_company_relevant_jobs(driver, company, search_terms)
-                if len(company_relevant_jobs) > 0:
-                    for job in company_relevant_jobs:
-                        relevant_jobs.append((company, job))
-                elif jobs_page_status in {JobsPageStatus.GENERIC_NO_JOBS_PHRASE_FOUND, JobsPageStatus.NO_JOBS_PHRASE_NOT_FOUND_BUT_NO_JOBS}:
-                    verify_no_jobs.append(company)
-            except Exception as e:
-                errors.append((company.name, e))
-        
+            companies_to_check.append(company)
         else:
             skipped_companies.append(company.name)
-    
-    driver.close()  # Close the original browser window
+
+    # Page loads are dominated by waiting on the network and sleeps, so check companies concurrently,
+    # each worker thread lazily creating and then reusing its own driver
+    worker_state = threading.local()
+    drivers = []
+    drivers_lock = threading.Lock()
+
+    def check_company(company):
+        if not hasattr(worker_state, "driver"):
+            # Not a per-company error. Fail the run, e.g. so the lambda's retries kick in when chrome is flaky to start
+            worker_state.driver = driver_factory()
+            with drivers_lock:
+                drivers.append(worker_state.driver)
+        print("Checking", company.name)
+        return get_company_relevant_jobs(worker_state.driver, company, search_terms_lower)
+
+    results = [None] * len(companies_to_check)
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = {executor.submit(check_company, company): i for i, company in enumerate(companies_to_check)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    except BaseException:
+        # E.g. Ctrl-C or a driver failing to start. Only wait on the companies already being checked, rather than going on to check the rest
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    finally:
+        executor.shutdown(wait=True)
+        for driver in drivers:
+            try:
+                driver.quit()  # Also ends the chrome and chromedriver processes, which close() leaves running
+            except Exception as e:
+                # E.g. chrome already crashed. Keep quitting the rest and keep this run's results
+                print("Error quitting driver:", e)
+
+    # Aggregate in config order so output doesn't depend on which page happened to load first
+    for company, company_relevant_jobs, jobs_page_status, error in results:
+        if error:
+            errors.append((company.name, error))
+        elif len(company_relevant_jobs) > 0:
+            for job in company_relevant_jobs:
+                relevant_jobs.append((company, job))
+        elif jobs_page_status in {JobsPageStatus.GENERIC_NO_JOBS_PHRASE_FOUND, JobsPageStatus.NO_JOBS_PHRASE_NOT_FOUND_BUT_NO_JOBS}:
+            verify_no_jobs.append(company)
+
     return relevant_jobs, skipped_companies, verify_no_jobs, errors
 
-def get_company_relevant_jobs(driver, company, search_terms) -> (list[JobPosting], JobsPageStatus):
-    driver.get(company.jobs_page)
-    time.sleep(company.load_sleep)
-    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);") # Scroll to bottom to lazy load everything
-    time.sleep(company.scroll_sleep)
-
-    company_has_jobs, jobs_page_status = has_jobs(driver, company)
-    if company_has_jobs:
-        if company.jobs_page_class:
-            jobs = company.jobs_page_class.get_jobs(driver)
-            if len(jobs) > 0:
-                jobs_page_status = JobsPageStatus.SOME_JOB_FOUND
-            relevant_jobs = [job for job in jobs if title_is_relevant(company, job.title, search_terms)]
+def get_company_relevant_jobs(driver, company, search_terms_lower) -> (Company, list[JobPosting], JobsPageStatus, Exception):
+    relevant_terms_lower = tuple(search_term.lower() for search_term in company.relevant_search_terms) if company.relevant_search_terms else tuple(search_terms_lower)
+
+    def is_relevant(title, terms_lower=relevant_terms_lower) -> bool:
+        title_lower = title.lower()
+        return any(search_term in title_lower for search_term in terms_lower)
+
+    try:
+        block_unneeded_resources(driver, company)
+        driver.get(company.jobs_page)
+        wait_for_load(driver, company)
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);") # Scroll to bottom to lazy load everything
+        wait_for_lazy_load(driver, company)
+
+        company_has_jobs, jobs_page_status = has_jobs(driver, company)
+        if company_has_jobs:
+            if company.jobs_page_class:
+                jobs = company.jobs_page_class.get_jobs(driver)
+                if len(jobs) > 0:
+                    jobs_page_status = JobsPageStatus.SOME_JOB_FOUND
+                relevant_jobs = [job for job in jobs if is_relevant(job.title)]
+            else:
+                raise Exception("Scrape not implemented")
         else:
-            raise Exception("Scrape not implemented")
-    else:
-        return [], jobs_page_status
+            return company, [], jobs_page_status, None
+    except Exception as e:
+        return company, [], None, e
+
+    return company, relevant_jobs, jobs_page_status, None
+
+def wait_for_load(driver, company):
+    if not company.ready_selector:
+        time.sleep(company.load_sleep)
+        return
+    try:
+        WebDriverWait(driver, company.ready_timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, company.ready_selector)))
+    except TimeoutException:
+        pass # E.g. no jobs container when there are no jobs. Let the no jobs phrase check decide
+
+def wait_for_lazy_load(driver, company):
+    if not company.ready_selector:
+        time.sleep(company.scroll_sleep)
+        return
+    try:
+        WebDriverWait(driver, company.ready_timeout, poll_frequency=0.5).until(element_count_is_stable(company.ready_selector))
+    except TimeoutException:
+        pass # Still loading more, scrape what's there
 
-    return relevant_jobs, jobs_page_status
+def element_count_is_stable(css_selector):
+    last_count = None
+
+    def predicate(driver):
+        nonlocal last_count
+        count = len(driver.find_elements(By.CSS_SELECTOR, css_selector))
+        is_stable = count == last_count
+        last_count = count
+        return is_stable
+    return predicate
+
+def block_unneeded_resources(driver, company):
+    # Blocked per company rather than at launch since a driver is reused across companies, and CSS can change the page's visible text
+    blocked_urls = FONT_URL_PATTERNS + (STYLESHEET_URL_PATTERNS if company.block_css else [])
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_urls})
 
 def has_jobs(driver, company) -> (bool, JobsPageStatus):
-    all_text_lower = driver.find_element(By.TAG_NAME, 'body').text.lower()
-    if all_text_lower is None or all_text_lower == "":
+    phrases_lower = [company.no_jobs_phrase.lower()] if company.no_jobs_phrase else GENERIC_NO_JOBS_PHRASES_LOWER
+    phrases_found = driver.execute_script(FIND_PHRASES_SCRIPT, phrases_lower)
+    if phrases_found is None:
         raise Exception(company.name + ": Error retrieving text")
     if company.no_jobs_phrase:
-        if company.no_jobs_phrase.lower() in all_text_lower:
+        if phrases_found[0]:
             return False, JobsPageStatus.SPECIFIC_NO_JOBS_PHRASE_FOUND
         return True, JobsPageStatus.NO_JOBS_PHRASE_NOT_FOUND_BUT_NO_JOBS
     else:
-        generic_no_jobs_phrases = ['No available positions', "No positions", "Sorry", "No job", "No current", "No open", 'None available', 'Don\'t have', 'don\'t currently', 'No openings']
-        has_jobs = all(phrase.lower() not in all_text_lower for phrase in generic_no_jobs_phrases)
+        has_jobs = not any(phrases_found)
         return has_jobs, JobsPageStatus.NO_JOBS_PHRASE_NOT_FOUND_BUT_NO_JOBS if has_jobs else JobsPageStatus.GENERIC_NO_JOBS_PHRASE_FOUND
 
-def title_is_relevant(company, title, search_terms) -> bool:
-    if company.relevant_search_terms:
-        return any(search_term.lower() in title.lower() for search_term in company.relevant_search_terms)
-
-    return any(search_term.lower() in title.lower() for search_term in search_terms)
-
 def format_new_jobs_message(new_jobs: dict[str, dict[str, any]]) -> str:
     message = ""
     for company_name, info in new_jobs.items():
@@ -154,21 +261,26 @@ if __name__ == "__main__":
     parser.add_argument('--dont_replace_run_record', action='store_true', help="Don't replace the run record file")
     parser.add_argument('--dont_write_run_record', action='store_true', help="Don't write the run record file")
     parser.add_argument('--headless', action='store_true', help="Run headless")
+    parser.add_argument('--max_workers', type=int, default=1, help="Number of companies to scrape concurrently, each with its own browser. Keep at 1 when debugging a scraper")
     args = parser.parse_args()
 
     with open(args.run_record_json) as f:
         run_record = RunRecord.from_dict(json.load(f))
 
-    options = webdriver.ChromeOptions()
-    if args.headless:
-        options.add_argument("--headless=new")
-    driver = webdriver.Chrome(options=options)
+    def create_driver():
+        options = webdriver.ChromeOptions()
+        options.page_load_strategy = 'eager' # Only need the DOM, don't wait on images, stylesheets etc.
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        if args.headless:
+            options.add_argument("--headless=new")
+        return webdriver.Chrome(options=options)
 
     new_relevant_jobs, run_record, verify_no_jobs = get_new_relevant_jobs(
-        driver, 
+        create_driver,
         run_record,
         args.limit_company,
-        args.additional_search_term
+        args.additional_search_term,
+        args.max_workers
     )
 
     if len(verify_no_jobs) > 0:
@@ -186,5 +298,5 @@ if __name__ == "__main__":
             path, extension = os.path.splitext(filename)
             filename = f"{path}_{str(datetime.datetime.now()).replace(" ", "_")}{extension}"
         with open(filename, 'w') as f:
-            json.dump(asdict(run_record), f, indent=4)
+            json.dump(asdict(run_record), f, separators=(',', ':'))
         print(f"Wrote new existing jobs to {filename}")
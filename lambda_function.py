@@ -4,96 +4,151 @@ import json
 import datetime
 import boto3
 import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
 from tempfile import mkdtemp
 
+from botocore.exceptions import ClientError
 from selenium import webdriver
 
 from models import *
 
+# Created once per container so warm invocations reuse the clients and their connections
+s3_client = boto3.client('s3')
+sns_client = boto3.client('sns')
+
+# Bound each driver's persisted cache, since it shares the lambda's 512 MB /tmp with the chrome profiles and pulled config
+CHROME_DISK_CACHE_SIZE = 32 * 1024 * 1024
+
+# Created once per container, so warm invocations reuse the same chrome profile dirs instead of filling /tmp with new ones
+chrome_dir = mkdtemp(prefix="chrome-")
+
+# ETags of the files already downloaded to this container, by local path
+downloaded_etags = {}
+
+def download_file(bucket_name, key, path):
+    # Skip the download if the local copy is still current, which also leaves the parsed config cached
+    conditions = {"IfNoneMatch": downloaded_etags[path]} if path in downloaded_etags and os.path.exists(path) else {}
+    try:
+        response = s3_client.get_object(Bucket=bucket_name, Key=key, **conditions)
+    except ClientError as e:
+        if e.response['Error']['Code'] == '304':
+            return
+        raise
+    body = response['Body'].read()
+    with open(path, 'wb') as f:
+        f.write(body)
+    downloaded_etags[path] = response['ETag']
+
 def lambda_handler(event, context, local=False):
     limit_company = event["limit_company"] if "limit_company" in event else None
     temp_term = event["temp_term"] if "temp_term" in event else None
     dont_replace_existing = event["dont_replace_existing"] if "dont_replace_existing" in event else False
     dont_write_existing = event["dont_write_existing"] if "dont_write_existing" in event else False
 
-    options = webdriver.ChromeOptions()
-
-    if not local:
-        service = webdriver.ChromeService("/opt/chromedriver")
-        options.binary_location = '/opt/chrome/chrome'
-
-    options.add_argument("--headless=new")
-    options.add_argument('--no-sandbox')
-    options.add_argument("--disable-gpu")
-    options.add_argument("--window-size=1280x1696")
-    options.add_argument("--single-process")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-dev-tools")
-    options.add_argument("--no-zygote")
-    options.add_argument(f"--user-data-dir={mkdtemp()}")
-    options.add_argument(f"--data-path={mkdtemp()}")
-    options.add_argument(f"--disk-cache-dir={mkdtemp()}")
-    options.add_argument("--remote-debugging-port=9222")
-
-    if local:
-        driver = webdriver.Chrome(options=options)
-    else:
-        driver = webdriver.Chrome(options=options, service=service)
+    max_workers = event["max_workers"] if "max_workers" in event else 2
+
+    # Each concurrent driver needs its own profile dirs, cache dir and debugging port
+    driver_ids = itertools.count()
+
+    def create_driver():
+        driver_id = next(driver_ids)
+        options = webdriver.ChromeOptions()
+        options.page_load_strategy = 'eager' # Only need the DOM, don't wait on images, stylesheets etc.
+
+        if not local:
+            service = webdriver.ChromeService("/opt/chromedriver")
+            options.binary_location = '/opt/chrome/chrome'
+
+        options.add_argument("--headless=new")
+        options.add_argument('--no-sandbox')
+        options.add_argument("--disable-gpu")
+        options.add_argument("--window-size=1280x1696")
+        options.add_argument("--single-process")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--disable-dev-tools")
+        options.add_argument("--no-zygote")
+        options.add_argument("--blink-settings=imagesEnabled=false")
+        options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+        options.add_argument(f"--user-data-dir={chrome_dir}/user-data/{driver_id}")
+        options.add_argument(f"--data-path={chrome_dir}/data/{driver_id}")
+        # Persisted across warm invocations of the same container, so shared ATS scripts stay cached
+        options.add_argument(f"--disk-cache-dir=/tmp/chrome-cache/{driver_id}")
+        options.add_argument(f"--disk-cache-size={CHROME_DISK_CACHE_SIZE}")
+        options.add_argument(f"--remote-debugging-port={9222 + driver_id}")
+
+        if local:
+            return webdriver.Chrome(options=options)
+        return webdriver.Chrome(options=options, service=service)
     
     # So that we can update the config without repackaging and deploying the image
     os.makedirs("/tmp/job_scrape", exist_ok=True)
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(event["aws_config"]["bucket_name"])
-    bucket.download_file(event["aws_config"]["config_file"], '/tmp/job_scrape/config.py')
-    bucket.download_file(event["aws_config"]["scrapers_file"], '/tmp/job_scrape/scrapers.py')
+    bucket_name = event["aws_config"]["bucket_name"]
+    run_record_key = event["aws_config"]["run_record_json"]
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        downloads = [
+            executor.submit(download_file, bucket_name, event["aws_config"]["config_file"], '/tmp/job_scrape/config.py'),
+            executor.submit(download_file, bucket_name, event["aws_config"]["scrapers_file"], '/tmp/job_scrape/scrapers.py'),
+        ]
+        run_record_download = executor.submit(lambda: s3_client.get_object(Bucket=bucket_name, Key=run_record_key)['Body'].read())
+        for download in downloads:
+            download.result()
+        file_content = run_record_download.result().decode('utf-8')
 
     sys.path.append(os.path.abspath("/tmp/job_scrape"))
 
-    run_record_object = s3.Object(event["aws_config"]["bucket_name"], event["aws_config"]["run_record_json"])
-    file_content = run_record_object.get()['Body'].read().decode('utf-8')
     run_record = RunRecord.from_dict(json.loads(file_content))
 
     # dynamic import so we can dynamically pull config file
     from jobscrape import get_new_relevant_jobs, format_new_jobs_message, format_errors_message
 
     new_relevant_jobs, run_record, verify_no_jobs = get_new_relevant_jobs(
-        driver,
+        create_driver,
         run_record,
         limit_company,
-        temp_term
+        temp_term,
+        max_workers
     )
     return_message = {}
-    
-    sns = boto3.client('sns')
-
-    if len(new_relevant_jobs) > 0:
-        new_jobs_message = format_new_jobs_message(new_relevant_jobs)
-
-        response = sns.publish(
-            TopicArn=event["aws_config"]["sns_topic_arn"],
-            Message=new_jobs_message,
-            Subject='New jobs',
-        )
-        print("New jobs:")
-        print(new_jobs_message)
-        return_message["new_jobs"] = new_jobs_message
-    
-    errors_message = format_errors_message(run_record.errors)
-    print(errors_message)
-    return_message["errors"] = errors_message
-    if run_record.has_new_error():
-        response = sns.publish(
-            TopicArn=event["aws_config"]["sns_topic_arn"],
-            Message=errors_message,
-            Subject='New scrape error(s)',
-        )
 
+    # The two notifications don't depend on each other, so send them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        notifications = []
+
+        if len(new_relevant_jobs) > 0:
+            new_jobs_message = format_new_jobs_message(new_relevant_jobs)
+
+            notifications.append(executor.submit(
+                sns_client.publish,
+                TopicArn=event["aws_config"]["sns_topic_arn"],
+                Message=new_jobs_message,
+                Subject='New jobs',
+            ))
+            print("New jobs:")
+            print(new_jobs_message)
+            return_message["new_jobs"] = new_jobs_message
+        
+        errors_message = format_errors_message(run_record.errors)
+        print(errors_message)
+        return_message["errors"] = errors_message
+        if run_record.has_new_error():
+            notifications.append(executor.submit(
+                sns_client.publish,
+                TopicArn=event["aws_config"]["sns_topic_arn"],
+                Message=errors_message,
+                Subject='New scrape error(s)',
+            ))
+
+        for notification in notifications:
+            notification.result() # Surface any failure
+
+    # Only record jobs as seen once they've been notified, so a failed publish is retried next run
     if dont_replace_existing:
         path, extension = os.path.splitext(event["aws_config"]["run_record_json"])
-        run_record_object = s3.Object(event["aws_config"]["bucket_name"], f"{path}_{str(datetime.datetime.now()).replace(" ", "_")}{extension}")
+        run_record_key = f"{path}_{str(datetime.datetime.now()).replace(" ", "_")}{extension}"
     if not dont_write_existing:
-        run_record_object.put(Body=json.dumps(asdict(run_record), indent=4))
+        s3_client.put_object(Bucket=bucket_name, Key=run_record_key, Body=json.dumps(asdict(run_record), separators=(',', ':')))
 
     return {
         'statusCode': 200,
@@ -113,6 +168,7 @@ if __name__ == "__main__":
         "sns_topic_arn": "",
     }
     "limit_company": "",
+    "max_workers": 2,
     "dont_replace_existing": true/false,
     "dont_write_existing": true/false,
 }
@@ -30,9 +30,12 @@ class Company:
     jobs_page_class: any = None
     load_sleep: int = 1
     scroll_sleep: int = 1
+    ready_selector: str = None
+    ready_timeout: int = 10
     diff_page: bool = False
     location: str = None
     no_jobs_phrase: str = None
+    block_css: bool = False
     notes: str = None
     relevant_search_terms: list[str] = None
     tags: list[str] = None